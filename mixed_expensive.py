@@ -14,11 +14,14 @@ class TranscriptEntry(BaseModel):
 
 client = Client()
 
+def upload_audio(path: str):
+    return client.files.upload(file=path)
+
 def load_audio(id: int):
-    return client.files.upload(file=f'data/case-{id}/audio.wav')
+    return upload_audio(f'data/case-{id}/audio.wav')
 
-def load_transcript(id: int) -> List[TranscriptEntry]:
-    with open(f'data/case-{id}/transcript.json', 'r') as file:
+def read_transcript(path: str) -> List[TranscriptEntry]:
+    with open(path, 'r') as file:
         raw = json.load(file)
     entries = []
     for entry in raw:
@@ -28,6 +31,9 @@ def load_transcript(id: int) -> List[TranscriptEntry]:
             continue
     return entries
 
+def load_transcript(id: int) -> List[TranscriptEntry]:
+    return read_transcript(f'data/case-{id}/transcript.json')
+
 def fmt_time(t: float) -> str:
     minutes = int(t // 60)
     seconds = int(t % 60)
@@ -1,6 +1,8 @@
 import json
+import os
+import numpy as np
 import soundfile as sf
-from typing import Literal, List, Iterator
+from typing import Literal, List, Iterator, Tuple
 import librosa
 from pydantic import BaseModel, ValidationError
 from google.genai import Client, types
@@ -17,8 +19,8 @@ class TranscriptEntry(BaseModel):
     end_time: float
 
 
-def load_transcript(id: int) -> Iterator[TranscriptEntry]:
-    with open(f"data/case-{id}/transcript.json", "rb") as file:
+def read_transcript(path: str) -> Iterator[TranscriptEntry]:
+    with open(path, "rb") as file:
         raw_transcript = json.load(file)
 
     assert isinstance(raw_transcript, list)
@@ -32,6 +34,10 @@ def load_transcript(id: int) -> Iterator[TranscriptEntry]:
             continue
 
 
+def load_transcript(id: int) -> Iterator[TranscriptEntry]:
+    return read_transcript(f"data/case-{id}/transcript.json")
+
+
 def join_transcript(id: int) -> str:
     transcript = list(load_transcript(id))
     lines = [f"{entry.role}: {entry.content}" for entry in transcript]
@@ -84,18 +90,28 @@ def detect_potential_cutoff(message: TranscriptEntry) -> bool:
     return result == "true"
 
 
-def cut_audio(inpath: str, outpath: str, start_time: float, end_time: float):
-    assert end_time > start_time
-
+def decode_audio(path: str) -> Tuple[np.ndarray, int]:
     # Load the audio file
-    audio, sample_rate = librosa.load(inpath, sr=None)
+    audio, sample_rate = librosa.load(path, sr=None)
 
     # Convert to mono
     audio = librosa.to_mono(audio)
 
+    return audio, sample_rate
+
+
+def write_segment(
+    audio: np.ndarray,
+    sample_rate: int,
+    outpath: str,
+    start_time: float,
+    end_time: float,
+):
+    assert end_time > start_time
+
     # Convert time to samples
     start_sample = int(start_time * sample_rate)
-    end_sample = int(end_time * sample_rate)
+    end_sample = int(min(end_time * sample_rate, len(audio)))
 
     # Clamp values to valid range
     start_sample = max(0, start_sample)
@@ -114,6 +130,11 @@ def cut_audio(inpath: str, outpath: str, start_time: float, end_time: float):
     sf.write(outpath, audio_segment, sample_rate)
 
 
+def cut_audio(inpath: str, outpath: str, start_time: float, end_time: float):
+    audio, sample_rate = decode_audio(inpath)
+    write_segment(audio, sample_rate, outpath, start_time, end_time)
+
+
 validate_cutoff_instructions = """
 You are a quality assurance agent for a voice call application.
 To preserve anonymity, you will only examine a short segment of the call.
@@ -123,60 +144,74 @@ Return true if the audio cuts out in the middle of the segment, otherwise return
 """
 
 
-if __name__ == "__main__":
-    for case_id in 1, 2, 3, 4, 5:
-        transcript = list(load_transcript(case_id))
+def validate_cutoffs(
+    transcript: List[TranscriptEntry],
+    audio: np.ndarray,
+    sample_rate: int,
+    outdir: str,
+) -> Iterator[Tuple[int, bool]]:
+    """Yields (message index, confirmed) for every potential cutoff in the transcript."""
 
-        for i, message in enumerate(transcript):
-            if detect_potential_cutoff(message):
-                context_messages = transcript[max(0, i - 2) : i + 2]
+    for i, message in enumerate(transcript):
+        if not detect_potential_cutoff(message):
+            continue
 
-                start_time = min(message.start_time for message in context_messages)
-                end_time = max(message.end_time for message in context_messages)
+        context_messages = transcript[max(0, i - 2) : i + 2]
 
-                if i < 3:
-                    start_time = 0
+        start_time = min(message.start_time for message in context_messages)
+        end_time = max(message.end_time for message in context_messages)
 
-                if i > len(transcript) - 2:
-                    end_time = float("inf")
+        if i < 3:
+            start_time = 0
 
-                print(f"Potential Cutoff: Case {case_id} Message {i}")
+        if i > len(transcript) - 2:
+            end_time = float("inf")
 
-                cut_audio(
-                    f"data/case-{case_id}/audio.wav",
-                    f"data/case-{case_id}/audio_{i}.wav",
-                    start_time,
-                    end_time,
-                )
+        segment_path = os.path.join(outdir, f"audio_{i}.wav")
+        write_segment(audio, sample_rate, segment_path, start_time, end_time)
 
-                audio_file = client.files.upload(
-                    file=f"data/case-{case_id}/audio_{i}.wav",
-                )
+        audio_file = client.files.upload(file=segment_path)
 
-                partial_transcript = "Transcript: \n\n" + "\n".join(
-                    fmt_message(message) for message in context_messages
-                )
+        partial_transcript = "Transcript: \n\n" + "\n".join(
+            fmt_message(message) for message in context_messages
+        )
+
+        try:
+            response = client.models.generate_content(
+                model="gemini-2.5-flash",
+                contents=[
+                    f"Your job is to determine if the audio file has a missing segment. If it does, return true. Otherwise, return false.",
+                    partial_transcript,
+                    audio_file,
+                ],
+                config={
+                    "response_mime_type": "application/json",
+                    "response_schema": Literal["true", "false"],
+                },
+            )
+        finally:
+            client.files.delete(name=audio_file.name)
 
-                response = client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=[
-                        f"Your job is to determine if the audio file has a missing segment. If it does, return true. Otherwise, return false.",
-                        partial_transcript,
-                        audio_file,
-                    ],
-                    config={
-                        "response_mime_type": "application/json",
-                        "response_schema": Literal["true", "false"],
-                    },
-                )
+        assert response.parsed is not None
+        assert isinstance(response.parsed, str)
 
-                assert response.parsed is not None
-                assert isinstance(response.parsed, str)
+        result = response.parsed.strip().lower()
 
-                result = response.parsed.strip().lower()
+        if result not in ["true", "false"]:
+            raise ValueError(f"Invalid response: {result, type(result)}")
+
+        yield i, result == "true"
+
+
+if __name__ == "__main__":
+    for case_id in 1, 2, 3, 4, 5:
+        transcript = list(load_transcript(case_id))
+        audio, sample_rate = decode_audio(f"data/case-{case_id}/audio.wav")
 
-                if result not in ["true", "false"]:
-                    raise ValueError(f"Invalid response: {result, type(result)}")
+        for i, confirmed in validate_cutoffs(
+            transcript, audio, sample_rate, f"data/case-{case_id}"
+        ):
+            print(f"Potential Cutoff: Case {case_id} Message {i}")
 
-                if result == "true":
-                    print("cutoff confirmed")
+            if confirmed:
+                print("cutoff confirmed")
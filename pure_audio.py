@@ -9,8 +9,11 @@ from pydantic import BaseModel
 
 client = Client()
 
+def upload_audio(path: str):
+    return client.files.upload(file=path)
+
 def load_audio(id: int):
-    return client.files.upload(file=f'data/case-{id}/audio.wav')
+    return upload_audio(f'data/case-{id}/audio.wav')
 
 class SingleCutoffFoundResponse(BaseModel):
     found: Literal["true"]
@@ -1,5 +1,5 @@
 import json
-from typing import Literal, List, Iterator
+from typing import Literal, List, Iterable, Iterator
 from pydantic import BaseModel, ValidationError
 from google.genai import Client, types
 
@@ -30,8 +30,8 @@ class TranscriptSegment(BaseModel):
     messages: list[TranscriptEntry]
 
 
-def load_transcript(id: int) -> Iterator[TranscriptEntry]:
-    with open(f"data/case-{id}/transcript.json", "rb") as file:
+def read_transcript(path: str) -> Iterator[TranscriptEntry]:
+    with open(path, "rb") as file:
         raw_transcript = json.load(file)
     for entry in raw_transcript:
         try:
@@ -45,18 +45,22 @@ def load_transcript(id: int) -> Iterator[TranscriptEntry]:
             continue
 
 
+def load_transcript(id: int) -> Iterator[TranscriptEntry]:
+    return read_transcript(f"data/case-{id}/transcript.json")
+
+
 def join_transcript(id: int) -> str:
     transcript = list(load_transcript(id))
     lines = [f"{entry.role}: {entry.content}" for entry in transcript]
     return "\n\n".join(lines)
 
 
-def segment_transcript(
-    id: int, gap_threshold: float = 1.0
+def segment_entries(
+    entries: Iterable[TranscriptEntry], gap_threshold: float = 1.0
 ) -> Iterator[TranscriptSegment]:
     current_segment: List[TranscriptEntry] = []
     prev_time_sec = None
-    for entry in load_transcript(id):
+    for entry in entries:
         if (
             prev_time_sec is not None
             and (entry.start_time - prev_time_sec) > gap_threshold
@@ -71,6 +75,12 @@ def segment_transcript(
         yield TranscriptSegment(messages=current_segment)
 
 
+def segment_transcript(
+    id: int, gap_threshold: float = 1.0
+) -> Iterator[TranscriptSegment]:
+    return segment_entries(load_transcript(id), gap_threshold)
+
+
 client = Client()
 
 
@@ -0,0 +1,760 @@
+"""
+Local HTTP service that runs the cutoff detection strategies on warm workers.
+
+    python server.py --port 8000 --workers 4 --queue-size 32
+
+Endpoints:
+    POST /jobs        submit a case; 202 with the job id, 503 when the queue is full
+    GET  /jobs/<id>   job status, and the result or error once it has finished
+    GET  /strategies  strategies that can be selected per job
+    GET  /metrics     queue depth, throughput, latency and cache statistics
+
+A job body is JSON with a "strategy" and either file paths ("transcript_path",
+"audio_path") or uploaded content ("transcript" as the transcript JSON list,
+"audio" as base64-encoded WAV bytes). Paths must lie inside --data-dir, and
+requests must be sent with Content-Type: application/json.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+import mixed_expensive
+import mixed_pipeline
+import pure_audio
+import pure_transcript
+
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+QUEUE_FULL = "Job queue is full"
+INTAKE_BUSY = "Too many uploads in progress"
+
+# Uploaded files expire on the Gemini side after 48 hours.
+UPLOADED_AUDIO_TTL = 24 * 60 * 60
+
+# How long shutdown waits for running jobs before removing their files anyway.
+STOP_GRACE_SECONDS = 30
+
+
+class JobRequest(BaseModel):
+    strategy: str
+    transcript_path: Optional[str] = None
+    audio_path: Optional[str] = None
+    transcript: Optional[List[Dict[str, Any]]] = None
+    audio: Optional[str] = None
+
+
+@dataclass
+class Case:
+    workdir: str
+    transcript_path: Optional[str]
+    audio_path: Optional[str]
+    audio_key: Optional[Tuple]
+
+
+class Job:
+    def __init__(self, strategy: str, case: Case):
+        self.id = uuid.uuid4().hex
+        self.strategy = strategy
+        self.case = case
+        self.status: Literal["queued", "running", "done", "failed"] = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "strategy": self.strategy,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class CacheEntry:
+    def __init__(self, value: Any):
+        self.value = value
+        self.created_at = time.monotonic()
+        self.users = 0
+        self.evicted = False
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache shared by the workers, with an optional entry lifetime.
+
+    Values are leased with `use`, so concurrent misses on a key wait for a single
+    `create()` call, and `on_evict` only runs once an evicted value is no longer in use.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[Any], None]] = None,
+    ):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.entries: "OrderedDict[Any, CacheEntry]" = OrderedDict()
+        self.pending: Dict[Any, Future] = {}
+        # Evicted entries that are still leased, disposed when their last user is done.
+        self.retired: List[CacheEntry] = []
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def use(self, key, create: Callable[[], Any]) -> Iterator[Any]:
+        entry = self.acquire(key, create)
+        try:
+            yield entry.value
+        finally:
+            with self.lock:
+                entry.users -= 1
+                disposed = []
+                if entry.users == 0 and entry in self.retired:
+                    self.retired.remove(entry)
+                    disposed.append(entry)
+            self.dispose(disposed)
+
+    def acquire(self, key, create: Callable[[], Any]) -> CacheEntry:
+        while True:
+            with self.lock:
+                disposed = self.expire()
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    entry.users += 1
+                else:
+                    pending = self.pending.get(key)
+                    creating = pending is None
+                    if creating:
+                        self.misses += 1
+                        pending = self.pending[key] = Future()
+            self.dispose(disposed)
+
+            if entry is not None:
+                return entry
+
+            if not creating:
+                # Another worker is creating this value; use it once it is ready.
+                pending.result()
+                continue
+
+            try:
+                entry = CacheEntry(create())
+            except BaseException as e:
+                with self.lock:
+                    del self.pending[key]
+                pending.set_exception(e)
+                raise
+
+            entry.users = 1
+            with self.lock:
+                self.entries[key] = entry
+                del self.pending[key]
+                disposed = []
+                while len(self.entries) > self.capacity:
+                    disposed += self.evict(next(iter(self.entries)))
+            pending.set_result(None)
+            self.dispose(disposed)
+            return entry
+
+    def expire(self) -> List[CacheEntry]:
+        if self.ttl is None:
+            return []
+        now = time.monotonic()
+        disposed = []
+        for key, entry in list(self.entries.items()):
+            if now - entry.created_at >= self.ttl:
+                disposed += self.evict(key)
+        return disposed
+
+    def evict(self, key) -> List[CacheEntry]:
+        entry = self.entries.pop(key)
+        entry.evicted = True
+        if entry.users > 0:
+            self.retired.append(entry)
+            return []
+        return [entry]
+
+    def dispose(self, entries: List[CacheEntry]):
+        if self.on_evict is not None:
+            for entry in entries:
+                self.on_evict(entry.value)
+
+    def clear(self):
+        """Evicts every entry and disposes of all values, including ones still in use."""
+
+        with self.lock:
+            for key in list(self.entries):
+                self.evict(key)
+            disposed, self.retired = self.retired, []
+        self.dispose(disposed)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "max": ordered[-1]}
+
+
+# Strategies
+
+
+def run_pure_audio_single(service: "Service", case: Case):
+    with service.remote_audio(case) as audio:
+        return pure_audio.find_cutoff_single(audio).model_dump()
+
+
+def run_pure_audio_multiple(service: "Service", case: Case):
+    with service.remote_audio(case) as audio:
+        results = pure_audio.find_cutoff_multiple(audio)
+    return [result.model_dump() for result in results]
+
+
+def run_pure_transcript(service: "Service", case: Case):
+    assert case.transcript_path is not None
+
+    entries = pure_transcript.read_transcript(case.transcript_path)
+    cutoffs = []
+    for segment in pure_transcript.segment_entries(entries):
+        if not any(entry.role == "Main Agent" for entry in segment.messages):
+            continue
+
+        if pure_transcript.detect_cutoff(segment):
+            cutoffs.append(
+                {
+                    "start_time": segment.messages[0].start_time,
+                    "end_time": segment.messages[-1].end_time,
+                    "messages": [entry.model_dump() for entry in segment.messages],
+                }
+            )
+    return cutoffs
+
+
+def run_mixed_expensive(service: "Service", case: Case):
+    assert case.transcript_path is not None
+
+    transcript = mixed_expensive.read_transcript(case.transcript_path)
+    transcript_text = mixed_expensive.format_transcript(transcript)
+    with service.remote_audio(case) as audio:
+        return mixed_expensive.find_cutoffs(audio, transcript_text)
+
+
+def run_mixed_pipeline(service: "Service", case: Case):
+    assert case.transcript_path is not None
+
+    transcript = list(mixed_pipeline.read_transcript(case.transcript_path))
+    with service.decoded_audio(case) as (audio, sample_rate):
+        return [
+            {
+                "message": i,
+                "start_time": transcript[i].start_time,
+                "end_time": transcript[i].end_time,
+                "confirmed": confirmed,
+            }
+            for i, confirmed in mixed_pipeline.validate_cutoffs(
+                transcript, audio, sample_rate, case.workdir
+            )
+        ]
+
+
+@dataclass(frozen=True)
+class Strategy:
+    run: Callable[["Service", Case], Any]
+    needs_transcript: bool
+    needs_audio: bool
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "pure_audio_single": Strategy(run_pure_audio_single, False, True),
+    "pure_audio_multiple": Strategy(run_pure_audio_multiple, False, True),
+    "pure_transcript": Strategy(run_pure_transcript, True, False),
+    "mixed_expensive": Strategy(run_mixed_expensive, True, True),
+    "mixed_pipeline": Strategy(run_mixed_pipeline, True, True),
+}
+
+
+class Service:
+    """Job queue, worker pool and metrics behind the HTTP handler."""
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        max_jobs: int,
+        audio_cache_size: int,
+        max_uploads: int,
+        data_dir: str,
+    ):
+        self.workers = workers
+        self.queue: "queue.Queue[Job]" = queue.Queue(maxsize=queue_size)
+        self.max_jobs = max_jobs
+        self.data_dir = os.path.realpath(data_dir)
+
+        # Bounds how many request bodies are being read and spooled at once.
+        self.intake = threading.BoundedSemaphore(max_uploads)
+
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.stopping = False
+
+        self.decoded_audio_cache = LRUCache(audio_cache_size)
+        self.remote_audio_cache = LRUCache(
+            audio_cache_size, ttl=UPLOADED_AUDIO_TTL, on_evict=delete_remote_audio
+        )
+
+        self.started_at = time.time()
+        self.submitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_intake_busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        # (finished_at, strategy, queue wait, processing time, succeeded)
+        self.history: "deque[Tuple[float, str, float, float, bool]]" = deque(
+            maxlen=1024
+        )
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(
+                target=self.work, name=f"worker-{i}", daemon=True
+            ).start()
+
+    def stop(self, grace: float = STOP_GRACE_SECONDS):
+        """Drops queued jobs, waits briefly for running ones, then removes their files."""
+
+        with self.lock:
+            self.stopping = True
+
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.cancel(job)
+            self.queue.task_done()
+
+        with self.idle:
+            self.idle.wait_for(lambda: self.running == 0, timeout=grace)
+            running = [job for job in self.jobs.values() if job.status == "running"]
+
+        for job in running:
+            shutil.rmtree(job.case.workdir, ignore_errors=True)
+
+        # Also deletes uploads still leased by jobs that did not finish in time.
+        self.remote_audio_cache.clear()
+
+    def cancel(self, job: Job):
+        with self.lock:
+            job.status = "failed"
+            job.error = "Service stopped"
+            job.finished_at = time.time()
+        shutil.rmtree(job.case.workdir, ignore_errors=True)
+
+    def remote_audio(self, case: Case):
+        assert case.audio_path is not None
+        return self.remote_audio_cache.use(
+            case.audio_key, lambda: pure_audio.upload_audio(case.audio_path)
+        )
+
+    def decoded_audio(self, case: Case):
+        assert case.audio_path is not None
+        return self.decoded_audio_cache.use(
+            case.audio_key, lambda: mixed_pipeline.decode_audio(case.audio_path)
+        )
+
+    def submit(self, request: JobRequest) -> Job:
+        """Queues a job, raising ValueError for a bad request and queue.Full when saturated."""
+
+        strategy = STRATEGIES.get(request.strategy)
+        if strategy is None:
+            raise ValueError(
+                f"Unknown strategy {request.strategy!r}, expected one of {sorted(STRATEGIES)}"
+            )
+
+        workdir = tempfile.mkdtemp(prefix="cutoff-job-")
+        try:
+            case = prepare_case(request, strategy, workdir, self.data_dir)
+            job = Job(request.strategy, case)
+
+            with self.lock:
+                self.queue.put_nowait(job)
+                self.jobs[job.id] = job
+                self.submitted += 1
+                self.evict_finished_jobs()
+        except queue.Full:
+            self.reject_queue_full()
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        except Exception:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+
+        return job
+
+    def reject_queue_full(self):
+        with self.lock:
+            self.rejected_queue_full += 1
+
+    def reject_intake_busy(self):
+        with self.lock:
+            self.rejected_intake_busy += 1
+
+    def evict_finished_jobs(self):
+        excess = len(self.jobs) - self.max_jobs
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id].status in ("done", "failed"):
+                del self.jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                stopping = self.stopping
+            if stopping:
+                self.cancel(job)
+                self.queue.task_done()
+                continue
+
+            with self.lock:
+                job.status = "running"
+                job.started_at = time.time()
+                self.running += 1
+
+            try:
+                result = STRATEGIES[job.strategy].run(self, job.case)
+                error = None
+            except Exception as e:
+                result = None
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                shutil.rmtree(job.case.workdir, ignore_errors=True)
+
+            with self.lock:
+                job.finished_at = time.time()
+                job.result = result
+                job.error = error
+                job.status = "done" if error is None else "failed"
+                self.running -= 1
+                self.idle.notify_all()
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.history.append(
+                    (
+                        job.finished_at,
+                        job.strategy,
+                        job.started_at - job.submitted_at,
+                        job.finished_at - job.started_at,
+                        error is None,
+                    )
+                )
+
+            self.queue.task_done()
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        with self.lock:
+            history = list(self.history)
+            counts = {
+                "submitted": self.submitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_intake_busy": self.rejected_intake_busy,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+        by_strategy = {}
+        for name in STRATEGIES:
+            runs = [h for h in history if h[1] == name]
+            by_strategy[name] = {
+                "recent_jobs": len(runs),
+                "recent_failures": sum(1 for h in runs if not h[4]),
+                "processing_seconds": percentiles([h[3] for h in runs]),
+            }
+
+        uptime = now - self.started_at
+        return {
+            "uptime_seconds": uptime,
+            "workers": self.workers,
+            "queue": {"depth": self.queue.qsize(), "capacity": self.queue.maxsize},
+            "jobs": counts,
+            "throughput": {
+                "jobs_last_minute": sum(1 for h in history if now - h[0] <= 60),
+                "jobs_per_minute_overall": (
+                    (counts["completed"] + counts["failed"]) / uptime * 60
+                    if uptime > 0
+                    else 0.0
+                ),
+            },
+            "latency_seconds": {
+                "queue_wait": percentiles([h[2] for h in history]),
+                "processing": percentiles([h[3] for h in history]),
+                "total": percentiles([h[2] + h[3] for h in history]),
+            },
+            "by_strategy": by_strategy,
+            "cache": {
+                "decoded_audio": self.decoded_audio_cache.stats(),
+                "uploaded_audio": self.remote_audio_cache.stats(),
+            },
+        }
+
+
+def delete_remote_audio(file):
+    try:
+        pure_audio.client.files.delete(name=file.name)
+    except Exception as e:
+        print(f"Failed to delete uploaded file {file.name}: {e}")
+
+
+def resolve_data_path(path: str, data_dir: str) -> str:
+    resolved = os.path.realpath(path)
+    if os.path.commonpath([resolved, data_dir]) != data_dir:
+        raise ValueError(f"Path must be inside the data directory: {path}")
+    if not os.path.isfile(resolved):
+        raise ValueError(f"No such file: {path}")
+    return resolved
+
+
+def path_key(path: str) -> Tuple:
+    stat = os.stat(path)
+    return ("path", os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def prepare_case(
+    request: JobRequest, strategy: Strategy, workdir: str, data_dir: str
+) -> Case:
+    """Resolves the request's transcript and audio into files the strategies can read."""
+
+    transcript_path = None
+    if strategy.needs_transcript:
+        if request.transcript is not None:
+            transcript_path = os.path.join(workdir, "transcript.json")
+            with open(transcript_path, "w") as file:
+                json.dump(request.transcript, file)
+        elif request.transcript_path is not None:
+            transcript_path = resolve_data_path(request.transcript_path, data_dir)
+        else:
+            raise ValueError(
+                f"Strategy {request.strategy!r} needs 'transcript' or 'transcript_path'"
+            )
+
+    audio_path = None
+    audio_key = None
+    if strategy.needs_audio:
+        if request.audio is not None:
+            try:
+                audio = base64.b64decode(request.audio, validate=True)
+            except binascii.Error:
+                raise ValueError("'audio' must be base64-encoded")
+            audio_path = os.path.join(workdir, "audio.wav")
+            with open(audio_path, "wb") as file:
+                file.write(audio)
+            audio_key = ("sha256", hashlib.sha256(audio).hexdigest())
+        elif request.audio_path is not None:
+            audio_path = resolve_data_path(request.audio_path, data_dir)
+            audio_key = path_key(audio_path)
+        else:
+            raise ValueError(
+                f"Strategy {request.strategy!r} needs 'audio' or 'audio_path'"
+            )
+
+    return Case(workdir, transcript_path, audio_path, audio_key)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: "Server"
+
+    # Seconds a connection may stall, so a slow body cannot hold an intake slot forever.
+    timeout = 30
+
+    def send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        service = self.server.service
+
+        if self.path == "/metrics":
+            self.send_json(200, service.metrics())
+        elif self.path == "/strategies":
+            self.send_json(
+                200,
+                {
+                    name: {
+                        "needs_transcript": strategy.needs_transcript,
+                        "needs_audio": strategy.needs_audio,
+                    }
+                    for name, strategy in STRATEGIES.items()
+                },
+            )
+        elif self.path.startswith("/jobs/"):
+            job = service.get(self.path[len("/jobs/") :])
+            if job is None:
+                self.send_json(404, {"error": "Unknown job"})
+            else:
+                self.send_json(200, job.to_json())
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        service = self.server.service
+
+        # Requiring JSON forces a CORS preflight, so web pages cannot submit jobs.
+        if self.headers.get_content_type() != "application/json":
+            self.send_json(415, {"error": "Content-Type must be application/json"})
+            return
+
+        content_length = self.headers.get("Content-Length")
+        if content_length is None:
+            self.send_json(411, {"error": "Content-Length is required"})
+            return
+
+        try:
+            length = int(content_length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {"error": f"Invalid Content-Length: {content_length}"})
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {"error": f"Body exceeds {MAX_BODY_BYTES} bytes"})
+            return
+
+        # Reject before reading the body so a saturated service stays cheap to refuse.
+        if service.queue.full():
+            service.reject_queue_full()
+            self.send_json(503, {"error": QUEUE_FULL}, {"Retry-After": "5"})
+            return
+        if not service.intake.acquire(blocking=False):
+            service.reject_intake_busy()
+            self.send_json(503, {"error": INTAKE_BUSY}, {"Retry-After": "5"})
+            return
+
+        try:
+            body = self.rfile.read(length)
+            if len(body) < length:
+                raise ValueError("Request body ended before Content-Length bytes")
+            request = JobRequest.model_validate_json(body)
+            job = service.submit(request)
+        except TimeoutError:
+            self.close_connection = True
+            self.send_json(408, {"error": "Timed out reading the request body"})
+        except (ValidationError, ValueError) as e:
+            self.send_json(400, {"error": str(e)})
+        except queue.Full:
+            self.send_json(503, {"error": QUEUE_FULL}, {"Retry-After": "5"})
+        else:
+            self.send_json(
+                202, {"id": job.id, "status": job.status}, {"Location": f"/jobs/{job.id}"}
+            )
+        finally:
+            service.intake.release()
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: Service):
+        super().__init__(address, Handler)
+        self.service = service
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--max-jobs", type=int, default=1000)
+    parser.add_argument("--audio-cache-size", type=int, default=8)
+    parser.add_argument("--max-uploads", type=int, default=4)
+    parser.add_argument("--data-dir", default="data")
+    args = parser.parse_args()
+
+    service = Service(
+        args.workers,
+        args.queue_size,
+        args.max_jobs,
+        args.audio_cache_size,
+        args.max_uploads,
+        args.data_dir,
+    )
+    service.start()
+
+    server = Server((args.host, args.port), service)
+    print(f"Listening on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()